@@ -1,4 +1,5 @@
 from fastapi import Request, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from typing import Optional
 
@@ -31,17 +32,23 @@ class JWTBearer(HTTPBearer):
             # Access token is invalid/expired, try to refresh automatically
             refresh_token = request.cookies.get("refresh_token")
             if refresh_token:
-                new_tokens = refresh_access_token(refresh_token)
+                # Rotation hits Mongo, keep it off the event loop
+                new_tokens = await run_in_threadpool(refresh_access_token, refresh_token)
                 if new_tokens:
                     # Set the new access token in request state for potential cookie update
                     request.state.new_access_token = new_tokens["access_token"]
+                    if "refresh_token" in new_tokens:
+                        request.state.new_refresh_token = new_tokens["refresh_token"]
                     # Verify the new access token
                     payload = self.verify_jwt(new_tokens["access_token"])
                     if payload:
+                        request.state.token_payload = payload
                         return payload
             
             raise HTTPException(status_code=401, detail="Invalid or expired access token")
         
+        # Expose the payload to later dependencies such as the rate limiter
+        request.state.token_payload = payload
         return payload
 
     def verify_jwt(self, jwtoken: str) -> dict:
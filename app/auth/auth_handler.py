@@ -1,12 +1,14 @@
 import time
 import secrets
-from typing import Dict, Optional
+from typing import Dict, Optional, Tuple
 from datetime import datetime, timedelta
 
 import jwt
 from dotenv import dotenv_values
 from passlib.context import CryptContext
-from app.config.database import refresh_tokens_collection
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from app.config.database import refresh_tokens_collection, refresh_tokens_fast_collection
 
 JWT_SECRET = dotenv_values(".env")['SECRET']
 JWT_ALGORITHM = dotenv_values(".env")['ALGORITHM']
@@ -14,9 +16,20 @@ JWT_ALGORITHM = dotenv_values(".env")['ALGORITHM']
 # Token expiry times (in seconds)
 ACCESS_TOKEN_EXPIRE_MINUTES = 15  # 15 minutes
 REFRESH_TOKEN_EXPIRE_DAYS = 7     # 7 days
+# A just-rotated refresh token is still accepted this long, for concurrent requests
+REFRESH_REUSE_GRACE_SECONDS = 30
+
+# bcrypt cost factor; hashes with any other cost are upgraded on next login
+BCRYPT_ROUNDS = int(dotenv_values(".env").get("BCRYPT_ROUNDS", 12))
 
 # create a password context using bcrypt
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS
+)
 
 def hash_password(password: str) -> str:
     """Hash a plain-text password."""
@@ -26,6 +39,13 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a plain-text password against the stored hash."""
     return pwd_context.verify(plain_password, hashed_password)
 
+def verify_and_update_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """
+    Verify a password and return a replacement hash if the stored one
+    uses an outdated scheme or bcrypt cost, else None.
+    """
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
 def token_response(access_token: str, refresh_token: str, token_type: str = "bearer"):
     return {
         "access_token": access_token,
@@ -43,31 +63,34 @@ def generate_access_token(user_id: str) -> str:
     }
     return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
 
-def generate_refresh_token(user_id: str) -> str:
-    """Generate a long-lived refresh token"""
+def generate_refresh_token(user_id: str, family_id: Optional[str] = None, generation: int = 0) -> str:
+    """
+    Generate a long-lived refresh token.
+    Tokens rotated from the same login share a family id; the generation
+    counts rotations so a replayed older token can be detected.
+    """
+    jti = secrets.token_urlsafe(32)
     payload = {
         "user_id": user_id,
         "token_type": "refresh",
         "exp": datetime.utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS),
         "iat": datetime.utcnow(),
-        "jti": secrets.token_urlsafe(32)  # Unique identifier for token revocation
+        "iat_ms": int(time.time() * 1000),  # Compared against logout-all cutoffs
+        "jti": jti,  # Unique identifier for this token
+        "fid": family_id or jti,
+        "gen": generation
     }
     return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
 
 def sign_jwt(user_id: str) -> Dict[str, str]:
-    """Generate both access and refresh tokens"""
+    """
+    Generate both access and refresh tokens.
+    Nothing is stored at login; a family record is only written on the
+    first refresh or on revocation.
+    """
     access_token = generate_access_token(user_id)
     refresh_token = generate_refresh_token(user_id)
     
-    # Store refresh token in database for tracking
-    refresh_payload = decode_jwt(refresh_token)
-    if refresh_payload:
-        store_refresh_token(
-            user_id,
-            refresh_payload.get("jti"),
-            datetime.utcfromtimestamp(refresh_payload.get("exp"))
-        )
-    
     return token_response(access_token, refresh_token)
 
 def decode_jwt(token: str) -> Optional[dict]:
@@ -94,53 +117,128 @@ def verify_refresh_token(token: str) -> Optional[dict]:
         return payload
     return None
 
-def store_refresh_token(user_id: str, token_jti: str, expires_at: datetime) -> bool:
-    """Store refresh token information in database"""
-    try:
-        refresh_tokens_collection.insert_one({
-            "user_id": user_id,
-            "token_jti": token_jti,
-            "expires_at": expires_at,
-            "created_at": datetime.utcnow(),
-            "is_revoked": False
-        })
-        return True
-    except Exception:
+def is_user_logged_out(user_id: str, payload: dict) -> bool:
+    """
+    Check whether the user logged out of all devices after the token was
+    issued. Compared in milliseconds so a login right after logout-all
+    isn't caught by its cutoff.
+    """
+    cutoff = refresh_tokens_collection.find_one(
+        {"_id": f"user:{user_id}"},
+        {"revoked_before": 1, "revoked_before_ms": 1}
+    )
+    if cutoff is None:
         return False
 
-def is_refresh_token_valid(token_jti: str) -> bool:
-    """Check if refresh token is valid and not revoked"""
-    token_doc = refresh_tokens_collection.find_one({
-        "token_jti": token_jti,
-        "is_revoked": False,
-        "expires_at": {"$gt": datetime.utcnow()}
-    })
-    return token_doc is not None
-
-def revoke_refresh_token(token_jti: str) -> bool:
-    """Revoke a refresh token"""
+    # Older tokens and cutoffs only have whole seconds: assume the end of that second
+    issued_at_ms = payload.get("iat_ms", payload.get("iat", 0) * 1000 + 999)
+    cutoff_ms = cutoff.get("revoked_before_ms", cutoff.get("revoked_before", 0) * 1000 + 999)
+    return issued_at_ms <= cutoff_ms
+
+def rotate_refresh_token(payload: dict) -> Optional[int]:
+    """
+    Atomically advance the token family to the next generation.
+    Returns the new generation, 0 if the token was already rotated within
+    the grace period, or None if the token is revoked or being reused.
+
+    The family record is only created from a generation 0 token. A later
+    generation whose family is gone (revoked and pruned) is rejected, so a
+    revoked family can't be recreated.
+    """
+    family_id = payload.get("fid") or payload.get("jti")
+    generation = payload.get("gen", 0)
+    now = datetime.utcnow()
+
     try:
-        result = refresh_tokens_collection.update_one(
-            {"token_jti": token_jti},
-            {"$set": {"is_revoked": True, "revoked_at": datetime.utcnow()}}
+        family = refresh_tokens_fast_collection.find_one_and_update(
+            {"_id": family_id, "generation": generation, "is_revoked": {"$ne": True}},
+            {
+                "$inc": {"generation": 1},
+                "$set": {
+                    "rotated_at": now,
+                    "expires_at": now + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+                },
+                "$setOnInsert": {"user_id": payload.get("user_id"), "created_at": now}
+            },
+            upsert=generation == 0,
+            return_document=ReturnDocument.AFTER
         )
-        return result.modified_count > 0
+        if family is None:
+            # A later generation without a matching family: it was pruned
+            # after revocation, or the token is being replayed
+            return _reject_reused_token(payload, family_id, generation, now)
+        return family["generation"]
+    except DuplicateKeyError:
+        # The family exists but at another generation, or is revoked
+        return _reject_reused_token(payload, family_id, generation, now)
+
+def _reject_reused_token(payload: dict, family_id: str, generation: int, now: datetime) -> Optional[int]:
+    """
+    Handle a token whose family is missing, revoked or has moved past its
+    generation.
+    Returns 0 within the concurrent-refresh grace period, otherwise revokes
+    the family and returns None.
+    """
+    family = refresh_tokens_collection.find_one({"_id": family_id})
+    if (
+        family
+        and not family.get("is_revoked")
+        and family.get("generation") == generation + 1
+        and now - family["rotated_at"] < timedelta(seconds=REFRESH_REUSE_GRACE_SECONDS)
+    ):
+        # Concurrent refresh with the token that was just rotated
+        return 0
+
+    # An old token was replayed: assume it leaked and kill the family
+    revoke_refresh_token(payload)
+    return None
+
+def revoke_refresh_token(payload: dict) -> bool:
+    """Revoke the refresh token family (login session) the token belongs to"""
+    try:
+        now = datetime.utcnow()
+        # Keep the record until every token of the family has expired. Later
+        # generations outlive the presented token, so don't use its exp.
+        refresh_tokens_collection.update_one(
+            {"_id": payload.get("fid") or payload.get("jti")},
+            {
+                "$set": {
+                    "is_revoked": True,
+                    "revoked_at": now,
+                    "expires_at": now + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+                },
+                "$setOnInsert": {"user_id": payload.get("user_id")}
+            },
+            upsert=True
+        )
+        return True
     except Exception:
         return False
 
 def revoke_all_user_refresh_tokens(user_id: str) -> bool:
-    """Revoke all refresh tokens for a user"""
+    """Revoke all refresh tokens issued to a user up to now"""
     try:
-        refresh_tokens_collection.update_many(
-            {"user_id": user_id, "is_revoked": False},
-            {"$set": {"is_revoked": True, "revoked_at": datetime.utcnow()}}
+        now = datetime.utcnow()
+        refresh_tokens_collection.update_one(
+            {"_id": f"user:{user_id}"},
+            {
+                "$set": {
+                    "revoked_before_ms": int(time.time() * 1000),
+                    "expires_at": now + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+                }
+            },
+            upsert=True
         )
         return True
     except Exception:
         return False
 
 def refresh_access_token(refresh_token: str) -> Optional[Dict[str, str]]:
-    """Generate new access token from valid refresh token"""
+    """
+    Generate a new access token from a valid refresh token, rotating the
+    refresh token. The result has no refresh_token when the presented
+    token was rotated moments ago by a concurrent request.
+    """
     payload = verify_refresh_token(refresh_token)
     if not payload:
         return None
@@ -151,14 +249,29 @@ def refresh_access_token(refresh_token: str) -> Optional[Dict[str, str]]:
     if not user_id or not token_jti:
         return None
     
-    # Check if refresh token is still valid in database
-    if not is_refresh_token_valid(token_jti):
+    # Tokens issued before rotation was introduced have one document each
+    if "fid" not in payload and not refresh_tokens_collection.find_one(
+        {"token_jti": token_jti, "is_revoked": False}, {"_id": 1}
+    ):
+        return None
+
+    if is_user_logged_out(user_id, payload):
+        return None
+
+    generation = rotate_refresh_token(payload)
+    if generation is None:
         return None
     
     # Generate new access token
-    new_access_token = generate_access_token(user_id)
-    
-    return {
-        "access_token": new_access_token,
+    new_tokens = {
+        "access_token": generate_access_token(user_id),
         "token_type": "bearer"
     }
+    if generation:
+        new_tokens["refresh_token"] = generate_refresh_token(
+            user_id,
+            family_id=payload.get("fid") or token_jti,
+            generation=generation
+        )
+    
+    return new_tokens
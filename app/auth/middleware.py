@@ -5,7 +5,7 @@ from typing import Callable
 
 class TokenRefreshMiddleware(BaseHTTPMiddleware):
     """
-    Middleware to automatically update access token cookies when they are refreshed
+    Middleware to automatically update token cookies when they are refreshed
     """
     
     async def dispatch(self, request: Request, call_next: Callable) -> Response:
@@ -23,4 +23,15 @@ class TokenRefreshMiddleware(BaseHTTPMiddleware):
                 samesite="lax"
             )
         
+        # The refresh token is rotated along with the access token
+        if hasattr(request.state, 'new_refresh_token'):
+            response.set_cookie(
+                key="refresh_token",
+                value=request.state.new_refresh_token,
+                max_age=7 * 24 * 60 * 60,  # 7 days
+                httponly=True,
+                secure=True,  # Set to True in production with HTTPS
+                samesite="lax"
+            )
+        
         return response
\ No newline at end of file
@@ -1,17 +1,152 @@
+import base64
+import hashlib
+import hmac
+from collections.abc import Mapping
+from contextlib import contextmanager
+
+import bson
+from bson.timestamp import Timestamp
 from pymongo.mongo_client import MongoClient
 from pymongo.server_api import ServerApi
+from pymongo.read_concern import ReadConcern
+from pymongo.read_preferences import SecondaryPreferred
+from pymongo.write_concern import WriteConcern
+from gridfs import GridFSBucket
 from dotenv import dotenv_values
 
 uri = dotenv_values(".env")['MONGO_URI']
+# Signs the causal consistency cookie handed to clients
+CAUSAL_TOKEN_SECRET = dotenv_values(".env")['SECRET'].encode("utf-8")
+
+# How stale a secondary may be to serve feed reads (MongoDB requires >= 90)
+MAX_STALENESS_SECONDS = int(dotenv_values(".env").get("MAX_STALENESS_SECONDS", 90))
 
 client = MongoClient(uri, server_api = ServerApi('1'))
 db = client.blog_fastapi
 blogs_collection = db["blogs"]
 users_collection = db["users"]
 refresh_tokens_collection = db["refresh_tokens"]
+# Large blog bodies are offloaded here instead of the blogs collection
+content_bucket = GridFSBucket(db, bucket_name="blog_content")
+
+# Per-route read preferences and per-operation write concerns
+secondary_preferred = SecondaryPreferred(max_staleness=MAX_STALENESS_SECONDS)
+# Feed and search reads tolerate slight staleness
+blogs_feed_collection = blogs_collection.with_options(read_preference=secondary_preferred)
+# Causally consistent reads of the author's own blogs, see causal_read_session
+blogs_causal_collection = blogs_collection.with_options(
+    read_preference=secondary_preferred,
+    read_concern=ReadConcern("majority")
+)
+# Blog writes are acknowledged by a majority so causal reads can see them
+blogs_write_collection = blogs_collection.with_options(write_concern=WriteConcern("majority"))
+# Refresh token rotation is on the latency-critical path of every refresh
+refresh_tokens_fast_collection = refresh_tokens_collection.with_options(write_concern=WriteConcern(w=1))
+
+
+@contextmanager
+def causal_write_session():
+    """Causally consistent session for writes that the author reads back"""
+    with client.start_session(causal_consistency=True) as session:
+        yield session
+
+
+def causal_token(session) -> str | None:
+    """
+    Serialize the session's cluster and operation time so a later request,
+    possibly served by another process, can read after this write
+    """
+    if session.cluster_time is None or session.operation_time is None:
+        return None
+    data = bson.encode({"cluster_time": session.cluster_time, "operation_time": session.operation_time})
+    signature = hmac.new(CAUSAL_TOKEN_SECRET, data, hashlib.sha256).digest()
+    return (
+        base64.urlsafe_b64encode(data).decode("ascii")
+        + "."
+        + base64.urlsafe_b64encode(signature).decode("ascii")
+    )
+
+
+def _decode_causal_token(token: str) -> dict | None:
+    """Verify and decode a causal token, returning None if it isn't one of ours"""
+    try:
+        encoded_data, _, encoded_signature = token.partition(".")
+        data = base64.urlsafe_b64decode(encoded_data)
+        signature = base64.urlsafe_b64decode(encoded_signature)
+        expected = hmac.new(CAUSAL_TOKEN_SECRET, data, hashlib.sha256).digest()
+        if not hmac.compare_digest(signature, expected):
+            return None
+
+        decoded = bson.decode(data)
+        cluster_time = decoded.get("cluster_time")
+        operation_time = decoded.get("operation_time")
+        if (
+            not isinstance(cluster_time, Mapping)
+            or not isinstance(cluster_time.get("clusterTime"), Timestamp)
+            or not isinstance(operation_time, Timestamp)
+        ):
+            return None
+        return decoded
+    except Exception:
+        return None
+
+
+@contextmanager
+def causal_read_session(token: str | None):
+    """
+    Session that reads after the write recorded in token.
+    Yields None when there is no usable token, in which case the caller
+    should read from the primary.
+    """
+    data = _decode_causal_token(token) if token else None
+    session = None
+    if data is not None:
+        try:
+            session = client.start_session(causal_consistency=True)
+            session.advance_cluster_time(data["cluster_time"])
+            session.advance_operation_time(data["operation_time"])
+        except Exception:
+            if session is not None:
+                session.end_session()
+            session = None
+
+    if session is None:
+        yield None
+        return
+
+    with session:
+        yield session
+
+
+_user_email_index_ready = False
+
+
+def ensure_user_email_index() -> bool:
+    """
+    Make sure the unique index on users.email exists.
+    Signup relies on it to reject duplicate emails, so callers must refuse
+    signups while this returns False. Retried on each call until it succeeds.
+    """
+    global _user_email_index_ready
+    if not _user_email_index_ready:
+        try:
+            users_collection.create_index("email", unique=True)
+            _user_email_index_ready = True
+        except Exception as e:
+            print(f"ERROR: unique index on users.email is missing, signups are disabled: {e}")
+    return _user_email_index_ready
+
 
 try:
     client.admin.command('ping')
     print("Pinged your deployment. You successfully connected to MongoDB!")
 except Exception as e:
-    print(e)
\ No newline at end of file
+    print(e)
+
+ensure_user_email_index()
+
+try:
+    # Prune refresh token families and revocations once they expire
+    refresh_tokens_collection.create_index("expires_at", expireAfterSeconds=0)
+except Exception as e:
+    print(f"ERROR: TTL index on refresh_tokens.expires_at is missing, tokens won't be pruned: {e}")
@@ -1,15 +1,58 @@
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
+from dotenv import dotenv_values
 
 from app.routes.entry import entry_root
 from app.routes.blog import blog_root
 from app.routes.auth import auth_root
 from app.auth.middleware import TokenRefreshMiddleware
+from app.middleware.compression import CompressionMiddleware
+from app.middleware.rate_limit import ConcurrencyLimitMiddleware
+from app.utils.title_index import title_index
+
+
+# Each worker has its own title index; rebuilding it bounds how long writes
+# handled by other workers (including deletes) stay invisible to it
+TITLE_INDEX_REFRESH_SECONDS = int(dotenv_values(".env").get("TITLE_INDEX_REFRESH_SECONDS", 60))
+TITLE_INDEX_RETRY_SECONDS = 5
+
+
+async def refresh_title_index():
+    """Build the title index, then rebuild it periodically, retrying failures sooner"""
+    while True:
+        try:
+            await run_in_threadpool(title_index.build)
+            delay = TITLE_INDEX_REFRESH_SECONDS
+        except Exception as e:
+            print(f"Failed to build the title index: {e}")
+            delay = TITLE_INDEX_RETRY_SECONDS
+        await asyncio.sleep(delay)
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    task = asyncio.create_task(refresh_title_index())
+    yield
+    task.cancel()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # Add middleware for automatic token refresh
 app.add_middleware(TokenRefreshMiddleware)
 
+# Add middleware for negotiated gzip/brotli response compression
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=int(dotenv_values(".env").get("COMPRESSION_MIN_SIZE", 500))
+)
+
+# Shed load per route class before it reaches the Mongo pool
+app.add_middleware(ConcurrencyLimitMiddleware)
+
 app.include_router(entry_root)
 app.include_router(blog_root)
 app.include_router(auth_root)
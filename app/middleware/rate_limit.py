@@ -0,0 +1,231 @@
+import math
+import threading
+from abc import ABC, abstractmethod
+import time
+from collections import OrderedDict
+
+from dotenv import dotenv_values
+from fastapi import HTTPException, Request, status
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+try:
+    import redis
+except ImportError:  # the shared backend is optional
+    redis = None
+
+_config = dotenv_values(".env")
+
+
+class RateLimitBackend(ABC):
+    """
+    Storage for token buckets. Subclass this to share buckets between
+    processes or nodes.
+    """
+
+    @abstractmethod
+    def consume(self, key: str, rate: float, capacity: int) -> float:
+        """
+        Take one token from the bucket identified by key.
+        Returns 0 if the request is allowed, otherwise the number of
+        seconds until a token becomes available.
+        """
+        ...
+
+
+class InMemoryRateLimitBackend(RateLimitBackend):
+    """Per-process token buckets, bounded to max_keys least recently used keys"""
+
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max_keys
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def consume(self, key: str, rate: float, capacity: int) -> float:
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.pop(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated_at) * rate)
+
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0.0
+            else:
+                wait = (1 - tokens) / rate
+
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+
+        return wait
+
+
+class RedisRateLimitBackend(RateLimitBackend):
+    """Token buckets shared between app instances through Redis"""
+
+    SCRIPT = """
+    local tokens = tonumber(redis.call('HGET', KEYS[1], 'tokens') or ARGV[2])
+    local updated_at = tonumber(redis.call('HGET', KEYS[1], 'updated_at') or ARGV[3])
+    local rate = tonumber(ARGV[1])
+    local capacity = tonumber(ARGV[2])
+    local now = tonumber(ARGV[3])
+    tokens = math.min(capacity, tokens + math.max(0, now - updated_at) * rate)
+    local wait = 0
+    if tokens >= 1 then
+        tokens = tokens - 1
+    else
+        wait = (1 - tokens) / rate
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated_at', now)
+    redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+    return tostring(wait)
+    """
+
+    def __init__(self, url: str):
+        # Short timeouts: a slow Redis should fall back, not stall requests
+        self._client = redis.Redis.from_url(url, socket_timeout=0.1, socket_connect_timeout=0.1)
+        self._script = self._client.register_script(self.SCRIPT)
+
+    def consume(self, key: str, rate: float, capacity: int) -> float:
+        return float(self._script(keys=[f"ratelimit:{key}"], args=[rate, capacity, time.time()]))
+
+
+class FallbackRateLimitBackend(RateLimitBackend):
+    """
+    Circuit breaker around a shared backend. After the primary fails,
+    requests use the per-process fallback for cooldown seconds before the
+    primary is tried again, so an outage doesn't add a timeout to every
+    request.
+    """
+
+    def __init__(self, primary: RateLimitBackend, fallback: RateLimitBackend, cooldown: float = 30):
+        self.primary = primary
+        self.fallback = fallback
+        self.cooldown = cooldown
+        self._open_until = 0.0
+
+    def consume(self, key: str, rate: float, capacity: int) -> float:
+        if time.monotonic() >= self._open_until:
+            try:
+                return self.primary.consume(key, rate, capacity)
+            except Exception as e:
+                print(f"Rate limit backend failed, using in-memory buckets for {self.cooldown}s: {e}")
+                self._open_until = time.monotonic() + self.cooldown
+        return self.fallback.consume(key, rate, capacity)
+
+
+# Used while a shared backend is failing, so limiting never takes routes down
+fallback_rate_limit_backend = InMemoryRateLimitBackend()
+
+
+def _default_backend() -> RateLimitBackend:
+    url = _config.get("RATE_LIMIT_REDIS_URL")
+    if url and redis is not None:
+        return FallbackRateLimitBackend(RedisRateLimitBackend(url), fallback_rate_limit_backend)
+    return fallback_rate_limit_backend
+
+
+rate_limit_backend = _default_backend()
+
+
+def client_ip(request: Request) -> str:
+    return request.client.host if request.client else "unknown"
+
+
+class RateLimiter:
+    """
+    Token-bucket rate limiting dependency.
+
+    Requests are keyed by the user id of the JWTBearer payload when it has
+    already run for this request, otherwise by client IP. Declare it after
+    the JWTBearer dependency so the payload is available.
+
+    This is a plain def so FastAPI runs it in the threadpool and a shared
+    backend's network I/O doesn't block the event loop. Shared backends
+    are wrapped in FallbackRateLimitBackend, so when they fail requests
+    are limited with per-process buckets instead.
+    """
+
+    def __init__(self, scope: str, rate: float, capacity: int, backend: RateLimitBackend | None = None):
+        self.scope = scope
+        self.rate = rate
+        self.capacity = capacity
+        if backend is not None and not isinstance(backend, (InMemoryRateLimitBackend, FallbackRateLimitBackend)):
+            backend = FallbackRateLimitBackend(backend, fallback_rate_limit_backend)
+        self.backend = backend
+
+    def __call__(self, request: Request) -> None:
+        token_payload = getattr(request.state, "token_payload", None)
+        if token_payload and token_payload.get("user_id"):
+            key = f"{self.scope}:user:{token_payload['user_id']}"
+        else:
+            key = f"{self.scope}:ip:{client_ip(request)}"
+
+        backend = self.backend or rate_limit_backend
+        wait = backend.consume(key, self.rate, self.capacity)
+        if wait > 0:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many requests",
+                headers={"Retry-After": str(math.ceil(wait))}
+            )
+
+
+def route_class(method: str, path: str) -> str:
+    """Group routes that share a concurrency limit"""
+    if path.startswith("/user"):
+        return "auth"
+    if path.startswith("/blog"):
+        # POST /blog/batch only reads; it just carries its ids in the body
+        if method == "GET" or path.rstrip("/") == "/blog/batch":
+            return "blog_read"
+        return "blog_write"
+    return "default"
+
+
+DEFAULT_CONCURRENCY_LIMITS = {
+    "auth": int(_config.get("CONCURRENCY_LIMIT_AUTH", 32)),
+    "blog_read": int(_config.get("CONCURRENCY_LIMIT_BLOG_READ", 64)),
+    "blog_write": int(_config.get("CONCURRENCY_LIMIT_BLOG_WRITE", 32)),
+}
+
+
+class ConcurrencyLimitMiddleware:
+    """
+    ASGI middleware capping in-flight requests per route class.
+    Requests over the limit are shed immediately with 503 and Retry-After
+    rather than queued behind a saturated Mongo pool.
+    """
+
+    def __init__(self, app: ASGIApp, limits: dict[str, int] | None = None, retry_after: int = 1):
+        self.app = app
+        self.limits = limits if limits is not None else DEFAULT_CONCURRENCY_LIMITS
+        self.retry_after = retry_after
+        self._in_flight: dict[str, int] = {}
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        group = route_class(scope["method"], scope["path"])
+        limit = self.limits.get(group)
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        # Single event loop, so a plain counter is enough
+        if self._in_flight.get(group, 0) >= limit:
+            response = JSONResponse(
+                {"detail": "Server is busy, please retry"},
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers={"Retry-After": str(self.retry_after)}
+            )
+            await response(scope, receive, send)
+            return
+
+        self._in_flight[group] = self._in_flight.get(group, 0) + 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self._in_flight[group] -= 1
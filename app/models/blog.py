@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 class Blog(BaseModel):
     title: str
@@ -12,4 +12,7 @@ class UpdateBlog(BaseModel):
     sub_title: str | None = None
     content: str | None = None
     author: str | None = None
-    tags: list | None = None
\ No newline at end of file
+    tags: list | None = None
+
+class BlogBatch(BaseModel):
+    ids: list[str] = Field(..., min_length=1)
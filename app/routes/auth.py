@@ -1,8 +1,9 @@
-from fastapi import APIRouter, Body, HTTPException, status, Response, Request
+from fastapi import APIRouter, Body, HTTPException, status, Response, Request, Depends
+from fastapi.concurrency import run_in_threadpool
 import datetime
 
 from app.auth.auth_handler import (
-    sign_jwt, hash_password, verify_password, 
+    sign_jwt, hash_password, verify_and_update_password,
     refresh_access_token, revoke_refresh_token,
     revoke_all_user_refresh_tokens, verify_refresh_token
 )
@@ -10,21 +11,29 @@ from app.models.user import (
     UserSchema, UserLoginSchema, RefreshTokenSchema,
     TokenResponseSchema, AccessTokenResponseSchema
 )
-from app.config.database import users_collection
+from app.config.database import users_collection, ensure_user_email_index
+from pymongo.errors import DuplicateKeyError
+from app.middleware.rate_limit import RateLimiter
 
 auth_root = APIRouter(prefix="/user", tags=["user"])
 
-@auth_root.post("/signup")
+# Per-IP token buckets for unauthenticated routes: (tokens per second, burst size)
+login_rate_limit = RateLimiter("login", rate=0.2, capacity=5)
+signup_rate_limit = RateLimiter("signup", rate=0.05, capacity=3)
+refresh_rate_limit = RateLimiter("refresh", rate=0.5, capacity=10)
+
+@auth_root.post("/signup", dependencies=[Depends(signup_rate_limit)])
 async def create_user(user: UserSchema = Body(...), response: Response = None):
     try:
-        res = users_collection.find_one({"email": user.email})
-        if res:
+        # Duplicate emails are only rejected by the unique index
+        if not await run_in_threadpool(ensure_user_email_index):
             raise HTTPException(
-                status_code=status.HTTP_409_CONFLICT,
-                detail="User with this email already exists"
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Signup is temporarily unavailable"
             )
-        
-        hashed_password = hash_password(user.password)
+
+        # bcrypt is CPU-bound, keep it off the event loop
+        hashed_password = await run_in_threadpool(hash_password, user.password)
         
         user_data = {
             **user.model_dump(),
@@ -33,7 +42,14 @@ async def create_user(user: UserSchema = Body(...), response: Response = None):
             "updated_at": datetime.datetime.now()
         }
         
-        res = users_collection.insert_one(user_data)
+        # The unique index on email rejects existing users atomically
+        try:
+            res = users_collection.insert_one(user_data)
+        except DuplicateKeyError:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="User with this email already exists"
+            )
         
         if not res.acknowledged:
             raise HTTPException(
@@ -72,10 +88,10 @@ async def create_user(user: UserSchema = Body(...), response: Response = None):
             detail=str(e)
         )
     
-@auth_root.post("/login")
+@auth_root.post("/login", dependencies=[Depends(login_rate_limit)])
 async def user_login(user: UserLoginSchema = Body(...), response: Response = None):
     try:
-        db_user = users_collection.find_one({"email": user.email})
+        db_user = users_collection.find_one({"email": user.email}, {"password": 1})
         
         # Check if user exists and password is correct
         if not db_user:
@@ -84,12 +100,22 @@ async def user_login(user: UserLoginSchema = Body(...), response: Response = Non
                 detail="Invalid email or password"
             )
         
-        if not verify_password(user.password, db_user["password"]):
+        verified, new_hash = await run_in_threadpool(
+            verify_and_update_password, user.password, db_user["password"]
+        )
+        if not verified:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Invalid email or password"
             )
 
+        # Transparently rehash passwords stored with an outdated bcrypt cost
+        if new_hash:
+            users_collection.update_one(
+                {"_id": db_user["_id"]},
+                {"$set": {"password": new_hash, "updated_at": datetime.datetime.now()}}
+            )
+
         # Generate tokens
         tokens = sign_jwt(db_user["_id"].__str__())
         
@@ -122,9 +148,9 @@ async def user_login(user: UserLoginSchema = Body(...), response: Response = Non
             detail=str(e)
         )
 
-@auth_root.post("/refresh")
+@auth_root.post("/refresh", dependencies=[Depends(refresh_rate_limit)])
 async def refresh_token(request: Request, response: Response):
-    """Refresh access token using refresh token from cookies"""
+    """Refresh access token using refresh token from cookies, rotating the refresh token"""
     try:
         # Get refresh token from cookies
         refresh_token = request.cookies.get("refresh_token")
@@ -134,7 +160,8 @@ async def refresh_token(request: Request, response: Response):
                 detail="No refresh token provided"
             )
         
-        new_tokens = refresh_access_token(refresh_token)
+        # Rotation hits Mongo, keep it off the event loop
+        new_tokens = await run_in_threadpool(refresh_access_token, refresh_token)
         if not new_tokens:
             # Clear invalid cookies
             response.delete_cookie("access_token")
@@ -154,6 +181,17 @@ async def refresh_token(request: Request, response: Response):
             samesite="lax"
         )
         
+        # Set the rotated refresh token cookie
+        if "refresh_token" in new_tokens:
+            response.set_cookie(
+                key="refresh_token",
+                value=new_tokens["refresh_token"],
+                max_age=7 * 24 * 60 * 60,  # 7 days
+                httponly=True,
+                secure=True,  # Set to True in production with HTTPS
+                samesite="lax"
+            )
+        
         return {"message": "Access token refreshed successfully"}
     except HTTPException:
         raise
@@ -173,10 +211,8 @@ async def logout(request: Request, response: Response):
         if refresh_token:
             # Verify and decode the refresh token
             payload = verify_refresh_token(refresh_token)
-            if payload:
-                token_jti = payload.get("jti")
-                if token_jti:
-                    revoke_refresh_token(token_jti)
+            if payload and payload.get("jti"):
+                revoke_refresh_token(payload)
         
         # Clear cookies regardless of token validity
         response.delete_cookie("access_token")
@@ -1,34 +1,79 @@
-from fastapi import APIRouter, HTTPException, status, Body, Depends
-from app.models.blog import Blog, UpdateBlog
-from app.config.database import blogs_collection
-from app.serializers.blog import DecodeBlog, DecodeBlogs, DecodeBlogWithAuthor, DecodeBlogsWithAuthor
+from fastapi import APIRouter, HTTPException, status, Body, Depends, Header, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from app.models.blog import Blog, UpdateBlog, BlogBatch
+from app.config.database import (
+    blogs_collection, blogs_feed_collection, blogs_causal_collection, blogs_write_collection,
+    content_bucket, causal_write_session, causal_read_session, causal_token
+)
+from app.serializers.blog import DecodeBlog, DecodeBlogs, DecodeBlogWithAuthor, DecodeBlogsWithAuthor, DecodeBlogSummariesWithAuthor
+from app.utils.content import build_content_metadata, store_content, delete_stored_content, decode_content
+from app.utils.title_index import title_index
+from app.utils.http_range import parse_range, RangeNotSatisfiable
 import datetime
+import io
 from bson import ObjectId
 from bson.errors import InvalidId
 from pymongo.errors import PyMongoError
 
 from app.auth.auth_bearer import JWTBearer
+from app.middleware.rate_limit import RateLimiter
 
 blog_root = APIRouter(prefix="/blog", tags=["blog"])
 
+# Per-user token buckets: (tokens per second, burst size)
+read_rate_limit = RateLimiter("blog_read", rate=5, capacity=20)
+write_rate_limit = RateLimiter("blog_write", rate=1, capacity=5)
+suggest_rate_limit = RateLimiter("blog_suggest", rate=20, capacity=40)
+
+MAX_BATCH_IDS = 100
+
+# Lets the author's next user_only read see their write on a secondary
+CAUSAL_COOKIE = "causal_ts"
+
+def set_causal_cookie(response: Response, session) -> None:
+    token = causal_token(session)
+    if token:
+        response.set_cookie(
+            key=CAUSAL_COOKIE,
+            value=token,
+            max_age=5 * 60,  # 5 minutes, after that reads fall back to the primary
+            httponly=True,
+            secure=True,  # Set to True in production with HTTPS
+            samesite="lax"
+        )
+
 @blog_root.post("/")
-def create_blog(doc: Blog, token_payload: dict = Depends(JWTBearer())):
+def create_blog(doc: Blog, response: Response, token_payload: dict = Depends(JWTBearer()), _: None = Depends(write_rate_limit)):
     try:
         doc = dict(doc)
         doc["created_at"] = datetime.datetime.now()
+        stored = store_content(doc["content"])
+        # Rendered HTML stays out of the document when the body is offloaded
+        doc.update(build_content_metadata(doc["content"], render=stored["content_file_id"] is None))
+        doc.update(stored)
         
         # Convert user_id string to ObjectId for proper referencing
         user_id = token_payload.get("user_id")  # Adjust field name based on your JWT payload structure
         doc["author"] = ObjectId(user_id)
         
-        res = blogs_collection.insert_one(doc)
+        try:
+            with causal_write_session() as session:
+                res = blogs_write_collection.insert_one(doc, session=session)
+                set_causal_cookie(response, session)
+        except Exception:
+            # Don't leave the freshly uploaded body behind
+            delete_stored_content(doc)
+            raise
 
         if not res.acknowledged:
+            delete_stored_content(doc)
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail="Failed to create blog"
             )
             
+        title_index.upsert(str(res.inserted_id), doc["title"])
+
         return {
             "status": "ok",
             "id": str(res.inserted_id),
@@ -40,8 +85,112 @@ def create_blog(doc: Blog, token_payload: dict = Depends(JWTBearer())):
             detail=str(e._message)
         )
     
+def get_blogs_by_ids(ids: list) -> list:
+    """
+    Resolve many blogs with a single $in aggregation. Results follow the
+    order of ids, with a not-found marker for ids that don't exist.
+    """
+    if len(ids) > MAX_BATCH_IDS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {MAX_BATCH_IDS} ids can be requested at once"
+        )
+
+    # Validate every id up front so a bad id fails the whole request
+    try:
+        object_ids = [ObjectId(blog_id) for blog_id in ids]
+    except (InvalidId, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid blog ID format"
+        )
+
+    pipeline = [
+        {"$match": {"_id": {"$in": list(set(object_ids))}}},
+        {
+            "$lookup": {
+                "from": "users",
+                "localField": "author",
+                "foreignField": "_id",
+                "as": "author_details"
+            }
+        },
+        {
+            "$unwind": {
+                "path": "$author_details",
+                "preserveNullAndEmptyArrays": True
+            }
+        },
+        {
+            "$project": {
+                "title": 1,
+                "sub_title": 1,
+                "content": 1,
+                "content_compressed": 1,
+                "content_file_id": 1,
+                "content_html": 1,
+                "content_html_sanitized": 1,
+                "excerpt": 1,
+                "word_count": 1,
+                "reading_time_minutes": 1,
+                "tags": 1,
+                "created_at": 1,
+                "author": {
+                    "_id": "$author_details._id",
+                    "fullname": "$author_details.fullname",
+                    "email": "$author_details.email"
+                }
+            }
+        }
+    ]
+
+    try:
+        blogs = {blog["_id"]: blog for blog in blogs_feed_collection.aggregate(pipeline)}
+    except PyMongoError:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Database error occurred"
+        )
+
+    return [
+        DecodeBlogWithAuthor(blogs[object_id]) if object_id in blogs
+        else {"id": str(object_id), "not_found": True}
+        for object_id in object_ids
+    ]
+
+@blog_root.get("/suggest")
+def suggest_titles(prefix: str = Query(..., min_length=1, max_length=100), limit: int = Query(10, ge=1, le=25), token_payload: dict = Depends(JWTBearer()), _: None = Depends(suggest_rate_limit)):
+    """As-you-type title suggestions served from the in-memory title index"""
+    return {
+        "status": "ok",
+        "data": title_index.suggest(prefix, limit)
+    }
+
+@blog_root.get("/batch")
+def get_blog_batch(ids: str, token_payload: dict = Depends(JWTBearer()), _: None = Depends(read_rate_limit)):
+    """Fetch several blogs at once, ids given as a comma-separated list"""
+    id_list = [blog_id.strip() for blog_id in ids.split(",") if blog_id.strip()]
+    if not id_list:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="No blog ids provided"
+        )
+
+    return {
+        "status": "ok",
+        "data": get_blogs_by_ids(id_list)
+    }
+
+@blog_root.post("/batch")
+def post_blog_batch(batch: BlogBatch, token_payload: dict = Depends(JWTBearer()), _: None = Depends(read_rate_limit)):
+    """Fetch several blogs at once, for id lists too long for a query string"""
+    return {
+        "status": "ok",
+        "data": get_blogs_by_ids(batch.ids)
+    }
+    
 @blog_root.get("/{id}")
-def get_blog(id: str, token_payload: dict = Depends(JWTBearer())):
+def get_blog(id: str, token_payload: dict = Depends(JWTBearer()), _: None = Depends(read_rate_limit)):
     try:
         # Use aggregation to populate author details
         pipeline = [
@@ -65,6 +214,13 @@ def get_blog(id: str, token_payload: dict = Depends(JWTBearer())):
                     "title": 1,
                     "sub_title": 1,
                     "content": 1,
+                    "content_compressed": 1,
+                    "content_file_id": 1,
+                    "content_html": 1,
+                    "content_html_sanitized": 1,
+                    "excerpt": 1,
+                    "word_count": 1,
+                    "reading_time_minutes": 1,
                     "tags": 1,
                     "created_at": 1,
                     "author": {
@@ -104,8 +260,78 @@ def get_blog(id: str, token_payload: dict = Depends(JWTBearer())):
             detail="Database error occurred"
         )
     
+CONTENT_CHUNK_SIZE = 64 * 1024
+
+def iter_content(stream, first: int, last: int):
+    """Yield the requested byte range of a file-like object in chunks"""
+    stream.seek(first)
+    remaining = last - first + 1
+    while remaining > 0:
+        chunk = stream.read(min(CONTENT_CHUNK_SIZE, remaining))
+        if not chunk:
+            break
+        remaining -= len(chunk)
+        yield chunk
+
+@blog_root.get("/{id}/content")
+def get_blog_content(id: str, token_payload: dict = Depends(JWTBearer()), _: None = Depends(read_rate_limit), range_header: str | None = Header(None, alias="Range")):
+    """Stream a blog's raw content in chunks, honouring HTTP Range requests"""
+    try:
+        blog = blogs_collection.find_one(
+            {"_id": ObjectId(id)},
+            {"content": 1, "content_compressed": 1, "content_file_id": 1}
+        )
+        if not blog:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Blog not found"
+            )
+
+        if blog.get("content_file_id"):
+            stream = content_bucket.open_download_stream(blog["content_file_id"])
+            size = stream.length
+        else:
+            stream = io.BytesIO((decode_content(blog) or "").encode("utf-8"))
+            size = len(stream.getbuffer())
+
+        headers = {"Accept-Ranges": "bytes"}
+        first, last = 0, size - 1
+        status_code = status.HTTP_200_OK
+
+        try:
+            byte_range = parse_range(range_header, size) if range_header else None
+        except RangeNotSatisfiable:
+            raise HTTPException(
+                status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+                detail="Requested range not satisfiable",
+                headers={"Content-Range": f"bytes */{size}"}
+            )
+        if byte_range is not None:
+            first, last = byte_range
+            status_code = status.HTTP_206_PARTIAL_CONTENT
+            headers["Content-Range"] = f"bytes {first}-{last}/{size}"
+
+        headers["Content-Length"] = str(last - first + 1 if size else 0)
+
+        return StreamingResponse(
+            iter_content(stream, first, last),
+            status_code=status_code,
+            media_type="text/plain; charset=utf-8",
+            headers=headers
+        )
+    except InvalidId:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid blog ID format"
+        )
+    except PyMongoError:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Database error occurred"
+        )
+    
 @blog_root.get("/")
-def get_blogs(token_payload: dict = Depends(JWTBearer()), user_only: bool = False):
+def get_blogs(request: Request, token_payload: dict = Depends(JWTBearer()), _: None = Depends(read_rate_limit), user_only: bool = False):
     try:
         # Build match stage based on user_only parameter
         match_stage = {}
@@ -133,7 +359,9 @@ def get_blogs(token_payload: dict = Depends(JWTBearer()), user_only: bool = Fals
                 "$project": {
                     "title": 1,
                     "sub_title": 1,
-                    "content": 1,
+                    "excerpt": 1,
+                    "word_count": 1,
+                    "reading_time_minutes": 1,
                     "tags": 1,
                     "created_at": 1,
                     "author": {
@@ -146,10 +374,25 @@ def get_blogs(token_payload: dict = Depends(JWTBearer()), user_only: bool = Fals
             {"$sort": {"created_at": -1}}  # Sort by newest first
         ]
         
-        blogs = list(blogs_collection.aggregate(pipeline))
+        if user_only:
+            # Read-your-writes for the author: causal read after their last
+            # write, or the primary if we don't know when that was
+            with causal_read_session(request.cookies.get(CAUSAL_COOKIE)) as session:
+                blogs = None
+                if session is not None:
+                    try:
+                        blogs = list(blogs_causal_collection.aggregate(pipeline, session=session))
+                    except PyMongoError:
+                        # e.g. the server no longer accepts the cookie's cluster time
+                        blogs = None
+                if blogs is None:
+                    blogs = list(blogs_collection.aggregate(pipeline))
+        else:
+            # The feed tolerates slightly stale secondaries
+            blogs = list(blogs_feed_collection.aggregate(pipeline))
         
         # Use the serializer function instead of manual conversion
-        decoded_blogs = DecodeBlogsWithAuthor(blogs)
+        decoded_blogs = DecodeBlogSummariesWithAuthor(blogs)
         
         return {
             "status": "ok",
@@ -162,7 +405,7 @@ def get_blogs(token_payload: dict = Depends(JWTBearer()), user_only: bool = Fals
         )
 
 @blog_root.patch("/{id}")
-def update_blog(id: str, doc: UpdateBlog, token_payload: dict = Depends(JWTBearer())):
+def update_blog(id: str, doc: UpdateBlog, response: Response, token_payload: dict = Depends(JWTBearer()), _: None = Depends(write_rate_limit)):
     try:
         req = dict(doc.model_dump(exclude_unset=True))
         
@@ -190,10 +433,45 @@ def update_blog(id: str, doc: UpdateBlog, token_payload: dict = Depends(JWTBeare
         if "author" in req:
             del req["author"]
 
-        res = blogs_collection.find_one_and_update(
-            {"_id": ObjectId(id)}, 
-            {"$set": req}
-        )
+        # Keep derived content fields in sync with the new content
+        if req.get("content") is not None:
+            stored = store_content(req["content"])
+            # Rendered HTML stays out of the document when the body is offloaded
+            req.update(build_content_metadata(req["content"], render=stored["content_file_id"] is None))
+            req.update(stored)
+
+        update = {"$set": req}
+        if "content_file_id" in req and "content_html" not in req:
+            # Don't keep HTML rendered from the previous content
+            update["$unset"] = {"content_html": "", "content_html_sanitized": ""}
+
+        try:
+            with causal_write_session() as session:
+                # Returns the pre-image, which tells us which body we replaced
+                res = blogs_write_collection.find_one_and_update(
+                    {"_id": ObjectId(id)}, 
+                    update,
+                    session=session
+                )
+                set_causal_cookie(response, session)
+        except Exception:
+            # Don't leave the freshly uploaded body behind
+            delete_stored_content(req)
+            raise
+
+        if res is None:
+            delete_stored_content(req)
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Blog not found"
+            )
+
+        if req.get("title") is not None:
+            title_index.upsert(id, req["title"])
+
+        # The previous body is no longer referenced once content is replaced
+        if "content_file_id" in req and res.get("content_file_id") != req["content_file_id"]:
+            delete_stored_content(res)
             
         return {
             "status": "ok",
@@ -211,7 +489,7 @@ def update_blog(id: str, doc: UpdateBlog, token_payload: dict = Depends(JWTBeare
         )
 
 @blog_root.delete("/{id}")
-def delete_blog(id: str, token_payload: dict = Depends(JWTBearer())):
+def delete_blog(id: str, response: Response, token_payload: dict = Depends(JWTBearer()), _: None = Depends(write_rate_limit)):
     try:
         # Authorization check: ensure user can only delete their own blogs
         existing_blog = blogs_collection.find_one({"_id": ObjectId(id)})
@@ -227,7 +505,12 @@ def delete_blog(id: str, token_payload: dict = Depends(JWTBearer())):
                 detail="Not authorized to delete this blog"
             )
         
-        res = blogs_collection.find_one_and_delete({"_id": ObjectId(id)})
+        with causal_write_session() as session:
+            res = blogs_write_collection.find_one_and_delete({"_id": ObjectId(id)}, session=session)
+            set_causal_cookie(response, session)
+        if res is not None:
+            delete_stored_content(res)
+        title_index.remove(id)
             
         return {
             "status": "ok",
@@ -0,0 +1,45 @@
+"""
+Backfill excerpt, word_count and reading_time_minutes for existing blogs,
+and re-render HTML that was stored before it was sanitized.
+
+Usage: python -m app.scripts.backfill_content_metadata
+"""
+from pymongo import UpdateOne
+
+from app.config.database import blogs_collection
+from app.utils.content import build_content_metadata, read_content
+
+BATCH_SIZE = 500
+
+
+def backfill(force: bool = False) -> int:
+    query = {} if force else {"$or": [
+        {"word_count": {"$exists": False}},
+        # HTML rendered before sanitizing was added
+        {"content_html": {"$exists": True}, "content_html_sanitized": {"$ne": True}}
+    ]}
+    cursor = blogs_collection.find(query, {"content": 1, "content_compressed": 1, "content_file_id": 1})
+
+    updated = 0
+    batch = []
+    for blog in cursor:
+        metadata = build_content_metadata(read_content(blog) or "", render=not blog.get("content_file_id"))
+        update = {"$set": metadata}
+        if "content_html" not in metadata:
+            update["$unset"] = {"content_html": "", "content_html_sanitized": ""}
+        batch.append(UpdateOne({"_id": blog["_id"]}, update))
+        if len(batch) >= BATCH_SIZE:
+            updated += blogs_collection.bulk_write(batch, ordered=False).modified_count
+            batch = []
+
+    if batch:
+        updated += blogs_collection.bulk_write(batch, ordered=False).modified_count
+
+    return updated
+
+
+if __name__ == "__main__":
+    import sys
+
+    count = backfill(force="--force" in sys.argv)
+    print(f"Updated {count} blogs")
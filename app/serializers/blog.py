@@ -1,9 +1,12 @@
+from app.utils.content import decode_content
+
+
 def DecodeBlog(data) -> dict:
     return {
         "_id": str(data["_id"]),
         "title": data["title"],
         "sub_title": data["sub_title"],
-        "content": data["content"],
+        "content": decode_content(data),
         "author": data["author"],
         "tags": data["tags"],
         "created_at": data["created_at"]
@@ -21,18 +24,55 @@ def DecodeBlogWithAuthor(blog) -> dict:
         "id": str(blog["_id"]),
         "title": blog["title"],
         "sub_title": blog["sub_title"],
-        "content": blog["content"],
+        "content": decode_content(blog),
+        # Offloaded bodies are streamed from /blog/{id}/content instead
+        "content_url": f"/blog/{blog['_id']}/content" if blog.get("content_file_id") else None,
+        "content_html": blog.get("content_html") if blog.get("content_html_sanitized") else None,
+        "excerpt": blog.get("excerpt"),
+        "word_count": blog.get("word_count"),
+        "reading_time_minutes": blog.get("reading_time_minutes"),
         "tags": blog["tags"],
         "created_at": blog["created_at"],
-        "author": {
-            "id": str(blog["author"]["_id"]) if blog.get("author") and blog["author"].get("_id") else None,
-            "fullname": blog["author"].get("fullname") if blog.get("author") else None,
-            "email": blog["author"].get("email") if blog.get("author") else None
-        }
+        "author": DecodeAuthor(blog)
     }
 
 def DecodeBlogsWithAuthor(blogs) -> list:
     """
     Decode multiple blog documents with populated author details
     """
-    return [DecodeBlogWithAuthor(blog) for blog in blogs]
\ No newline at end of file
+    return [DecodeBlogWithAuthor(blog) for blog in blogs]
+
+
+def DecodeBlogSummaryWithAuthor(blog) -> dict:
+    """
+    Decode a blog document for list views: precomputed excerpt and
+    reading-time fields instead of the full content
+    """
+    return {
+        "id": str(blog["_id"]),
+        "title": blog["title"],
+        "sub_title": blog["sub_title"],
+        "excerpt": blog.get("excerpt"),
+        "word_count": blog.get("word_count"),
+        "reading_time_minutes": blog.get("reading_time_minutes"),
+        "tags": blog["tags"],
+        "created_at": blog["created_at"],
+        "author": DecodeAuthor(blog)
+    }
+
+def DecodeBlogSummariesWithAuthor(blogs) -> list:
+    """
+    Decode multiple blog documents for list views
+    """
+    return [DecodeBlogSummaryWithAuthor(blog) for blog in blogs]
+
+
+def DecodeAuthor(blog) -> dict:
+    """
+    Decode the populated author details of a blog document
+    """
+    return {
+        "id": str(blog["author"]["_id"]) if blog.get("author") and blog["author"].get("_id") else None,
+        "fullname": blog["author"].get("fullname") if blog.get("author") else None,
+        "email": blog["author"].get("email") if blog.get("author") else None
+    }
\ No newline at end of file
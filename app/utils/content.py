@@ -0,0 +1,133 @@
+import math
+import re
+import zlib
+
+from bson.binary import Binary
+from dotenv import dotenv_values
+
+from app.config.database import content_bucket
+
+try:
+    import markdown
+    import nh3
+except ImportError:  # rendering is optional, and never done without sanitizing
+    markdown = None
+    nh3 = None
+
+EXCERPT_LENGTH = 200        # characters
+WORDS_PER_MINUTE = 200
+
+# Optional compression of large content values stored in Mongo
+_config = dotenv_values(".env")
+COMPRESS_CONTENT = str(_config.get("COMPRESS_CONTENT", "false")).lower() in ("1", "true", "yes")
+COMPRESS_CONTENT_MIN_SIZE = int(_config.get("COMPRESS_CONTENT_MIN_SIZE", 4096))  # bytes
+
+# Content at or above this size is moved out of the blog document into GridFS
+GRIDFS_CONTENT_MIN_SIZE = int(_config.get("GRIDFS_CONTENT_MIN_SIZE", 256 * 1024))  # bytes
+
+_TAG_RE = re.compile(r"<[^>]+>")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def build_excerpt(content: str, length: int = EXCERPT_LENGTH) -> str:
+    """Plain-text excerpt of the content, cut on a word boundary"""
+    text = _WHITESPACE_RE.sub(" ", _TAG_RE.sub(" ", content)).strip()
+    if len(text) <= length:
+        return text
+    cut = text[:length].rsplit(" ", 1)[0]
+    return cut.rstrip(".,;:!?") + "..."
+
+
+def count_words(content: str) -> int:
+    """Count words in the content, ignoring any HTML tags"""
+    return len(_TAG_RE.sub(" ", content).split())
+
+
+def render_html(content: str) -> str | None:
+    """
+    Render markdown content to sanitized HTML if the markdown and nh3
+    packages are installed. Authors' raw HTML passes through markdown, so
+    the output is cleaned with nh3's allowlist before it's stored.
+    """
+    if markdown is None or nh3 is None:
+        return None
+    return nh3.clean(markdown.markdown(content))
+
+
+def build_content_metadata(content: str, render: bool = True) -> dict:
+    """
+    Compute the derived fields stored alongside a blog's content.
+    Pass render=False for bodies offloaded to GridFS so their rendered HTML
+    doesn't end up back in the blog document.
+    """
+    word_count = count_words(content)
+    metadata = {
+        "excerpt": build_excerpt(content),
+        "word_count": word_count,
+        "reading_time_minutes": math.ceil(word_count / WORDS_PER_MINUTE) if word_count else 0
+    }
+
+    content_html = render_html(content) if render else None
+    if content_html is not None:
+        metadata["content_html"] = content_html
+        # Marks HTML produced by render_html; older unsanitized values are never served
+        metadata["content_html_sanitized"] = True
+
+    return metadata
+
+
+def encode_content(content: str) -> dict:
+    """
+    Prepare content for storage, compressing it with zlib when enabled
+    and above the size threshold
+    """
+    raw = content.encode("utf-8")
+    if COMPRESS_CONTENT and len(raw) >= COMPRESS_CONTENT_MIN_SIZE:
+        compressed = zlib.compress(raw)
+        if len(compressed) < len(raw):
+            return {"content": Binary(compressed), "content_compressed": True}
+    return {"content": content, "content_compressed": False}
+
+
+def decode_content(blog: dict) -> str | None:
+    """Return the plain-text content of a stored blog document"""
+    content = blog.get("content")
+    if blog.get("content_compressed") and content is not None:
+        return zlib.decompress(content).decode("utf-8")
+    return content
+
+
+def store_content(content: str) -> dict:
+    """
+    Prepare content for storage. Large bodies are uploaded to GridFS and
+    only referenced from the blog document; the rest go through
+    encode_content.
+    """
+    raw = content.encode("utf-8")
+    if len(raw) >= GRIDFS_CONTENT_MIN_SIZE:
+        file_id = content_bucket.upload_from_stream(
+            "content.txt",
+            raw,
+            metadata={"contentType": "text/plain; charset=utf-8"}
+        )
+        return {
+            "content": None,
+            "content_compressed": False,
+            "content_file_id": file_id,
+            "content_size": len(raw)
+        }
+
+    return {**encode_content(content), "content_file_id": None, "content_size": len(raw)}
+
+
+def delete_stored_content(blog: dict) -> None:
+    """Remove the GridFS file backing a blog's content, if any"""
+    if blog.get("content_file_id"):
+        content_bucket.delete(blog["content_file_id"])
+
+
+def read_content(blog: dict) -> str | None:
+    """Return the full content of a blog, reading it from GridFS if offloaded"""
+    if blog.get("content_file_id"):
+        return content_bucket.open_download_stream(blog["content_file_id"]).read().decode("utf-8")
+    return decode_content(blog)
@@ -0,0 +1,42 @@
+import re
+
+_BYTE_RANGE_RE = re.compile(r"(\d*)-(\d*)", re.ASCII)
+
+
+class RangeNotSatisfiable(ValueError):
+    """A well-formed byte range that lies outside the resource"""
+
+
+def parse_range(range_header: str, size: int) -> tuple[int, int] | None:
+    """
+    Parse a single "bytes=start-end" range into inclusive offsets.
+    Returns None when the header is malformed, uses another unit or asks
+    for several ranges; such a header is ignored and the full body served.
+    Raises RangeNotSatisfiable for a well-formed range that can't be satisfied.
+    """
+    unit, _, spec = range_header.partition("=")
+    if unit.strip().lower() != "bytes":
+        return None
+
+    # ASCII digits only: int() rejects some characters str.isdigit() accepts
+    match = _BYTE_RANGE_RE.fullmatch(spec.strip())
+    if match is None:
+        return None
+    start, end = match.groups()
+
+    if start:
+        first = int(start)
+        last = int(end) if end else size - 1
+        if end and last < first:
+            return None
+    elif end:
+        # Suffix range: the last N bytes
+        suffix = int(end)
+        first = max(size - suffix, 0)
+        last = size - 1 if suffix else -1
+    else:
+        return None
+
+    if first >= size or last < first:
+        raise RangeNotSatisfiable(f"bytes */{size}")
+    return first, min(last, size - 1)
@@ -0,0 +1,136 @@
+import threading
+import unicodedata
+from bisect import bisect_left, insort
+from collections import OrderedDict
+
+from app.config.database import blogs_feed_collection
+
+MAX_TITLE_LENGTH = 120     # characters of normalized title kept in the index
+MAX_ENTRIES = 200_000
+
+
+def normalize_title(title: str) -> str:
+    """Casefold, strip accents and collapse whitespace for prefix matching"""
+    decomposed = unicodedata.normalize("NFKD", title)
+    stripped = "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return " ".join(stripped.casefold().split())[:MAX_TITLE_LENGTH]
+
+
+class TitleIndex:
+    """
+    Sorted in-memory index of normalized blog titles for prefix lookups.
+    Lookups are a binary search plus a short scan, so they stay well under
+    a millisecond regardless of the number of blogs. Memory is bounded by
+    evicting the oldest blogs once max_entries is reached.
+    """
+
+    def __init__(self, max_entries: int = MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._keys: list[tuple[str, str]] = []    # (normalized title, blog id), sorted
+        self._titles: dict[str, str] = {}         # blog id -> original title
+        # blog id -> normalized title, oldest blog first
+        self._normalized: OrderedDict[str, str] = OrderedDict()
+        self._lock = threading.Lock()
+        # Local writes made while build() reads the collection, replayed after the swap
+        self._pending: list[tuple[str, str | None]] | None = None
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def build(self) -> None:
+        """
+        (Re)build the index from the blogs collection. Call it periodically
+        to pick up writes handled by other processes.
+        """
+        with self._lock:
+            self._pending = []
+        try:
+            keys, titles, normalized = self._load()
+        except Exception:
+            with self._lock:
+                self._pending = None
+            raise
+
+        with self._lock:
+            pending, self._pending = self._pending, None
+            self._keys = keys
+            self._titles = titles
+            self._normalized = normalized
+            # The snapshot may predate writes this process made meanwhile
+            for blog_id, title in pending:
+                if title is None:
+                    self._remove(blog_id)
+                else:
+                    self._upsert(blog_id, title)
+
+    def _load(self) -> tuple:
+        keys = []
+        titles = {}
+        normalized = OrderedDict()
+        cursor = blogs_feed_collection.find({}, {"title": 1}).sort("created_at", -1).limit(self.max_entries)
+        # Newest first from the cursor, stored oldest first for eviction
+        for blog in reversed(list(cursor)):
+            blog_id = str(blog["_id"])
+            title = blog.get("title") or ""
+            titles[blog_id] = title
+            normalized[blog_id] = normalize_title(title)
+            keys.append((normalized[blog_id], blog_id))
+        keys.sort()
+        return keys, titles, normalized
+
+    def upsert(self, blog_id: str, title: str) -> None:
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((blog_id, title))
+            self._upsert(blog_id, title)
+
+    def _upsert(self, blog_id: str, title: str) -> None:
+        key = normalize_title(title)
+        if blog_id in self._normalized:
+            # Retitled blog: replace its key but keep its age
+            self._remove_key(self._normalized[blog_id], blog_id)
+        else:
+            while self._normalized and len(self._normalized) >= self.max_entries:
+                oldest_id = next(iter(self._normalized))
+                self._remove(oldest_id)
+        insort(self._keys, (key, blog_id))
+        self._titles[blog_id] = title
+        self._normalized[blog_id] = key
+
+    def remove(self, blog_id: str) -> None:
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((blog_id, None))
+            self._remove(blog_id)
+
+    def _remove(self, blog_id: str) -> None:
+        key = self._normalized.pop(blog_id, None)
+        if key is None:
+            return
+        self._titles.pop(blog_id, None)
+        self._remove_key(key, blog_id)
+
+    def _remove_key(self, key: str, blog_id: str) -> None:
+        position = bisect_left(self._keys, (key, blog_id))
+        if position < len(self._keys) and self._keys[position] == (key, blog_id):
+            del self._keys[position]
+
+    def suggest(self, prefix: str, limit: int = 10) -> list:
+        """Return up to limit blogs whose normalized title starts with prefix"""
+        key = normalize_title(prefix)
+        if not key:
+            return []
+
+        results = []
+        with self._lock:
+            position = bisect_left(self._keys, (key, ""))
+            while position < len(self._keys) and len(results) < limit:
+                title_key, blog_id = self._keys[position]
+                if not title_key.startswith(key):
+                    break
+                results.append({"id": blog_id, "title": self._titles[blog_id]})
+                position += 1
+        return results
+
+
+title_index = TitleIndex()
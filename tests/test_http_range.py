@@ -0,0 +1,40 @@
+import pytest
+
+from app.utils.http_range import parse_range, RangeNotSatisfiable
+
+
+@pytest.mark.parametrize("header", [
+    "items=0-1",        # unknown unit
+    "bytes=3-1",        # last before first
+    "bytes=-",          # no offsets at all
+    "bytes=0-1,4-5",    # multiple ranges are not supported
+    "bytes=abc",
+    "bytes=²-",    # latin-1 0xB2: isdigit() but not an int
+    "bytes=1-³",
+    "bytes=١-",    # non-ASCII digit
+])
+def test_malformed_range_is_ignored(header):
+    assert parse_range(header, 10) is None
+
+
+def test_closed_range():
+    assert parse_range("bytes=0-4", 10) == (0, 4)
+
+
+def test_open_ended_range():
+    assert parse_range("bytes=5-", 10) == (5, 9)
+
+
+def test_suffix_range():
+    assert parse_range("bytes=-3", 10) == (7, 9)
+    assert parse_range("bytes=-30", 10) == (0, 9)
+
+
+def test_last_is_clamped_to_size():
+    assert parse_range("bytes=2-100", 10) == (2, 9)
+
+
+@pytest.mark.parametrize("header", ["bytes=-0", "bytes=10-20", "bytes=10-"])
+def test_unsatisfiable_range(header):
+    with pytest.raises(RangeNotSatisfiable):
+        parse_range(header, 10)